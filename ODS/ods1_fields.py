@@ -3,8 +3,6 @@
 
 """Decoding various ODS-1 data fields to ASCII for humans"""
 
-import io
-
 # ODS-1 File Header bits
 
 # file protection bits = 1 to deny access:
@@ -67,24 +65,15 @@ def fmt_datim( fh):
 #   return '{}-{}-{} {}:{}:{}'.format(
 #       dat[:2], dat[2:5], dat[5:], tim[:2], tim[ 2:4], tim[4:])
 
+# Access string for each possible 4-bit accessor protection nibble
+_PROT = tuple( ''.join( c for c, bit in zip( 'RWED',
+                ( FP_RDV, FP_WRV, FP_EXT, FP_DEL)) if not n & bit)
+               for n in range( 16))
+
 def fmt_protection( wd):
     "format SOGW protection from given word"
-    buf = io.StringIO()
-    w = wd
-    for accessor in FP_Accessors:  #'System', 'Owner', 'Group', 'World'
-        if not w & FP_RDV:
-            buf.write( 'R')
-        if not w & FP_WRV:
-            buf.write( 'W')
-        if not w & FP_EXT:
-            buf.write( 'E')
-        if not w & FP_DEL:
-            buf.write( 'D')
-        w >>= 4
-        buf.write( ',')
-    result = buf.getvalue()[ :-1]
-    buf.close()
-    return result
+    #'System', 'Owner', 'Group', 'World' nibbles, low to high
+    return ','.join( _PROT[ ( wd >> shift) & 0xF] for shift in ( 0, 4, 8, 12))
 
 def fmt_ratt( fh):
     "format the record attributes from beginning of fh.UFAT"
@@ -2,7 +2,7 @@
 # -*- encoding: utf-8 -*-
 "List all the files in an ODS-1 disk"
 
-import copy, hashlib, io, sys
+import array, bisect, functools, hashlib, io, itertools, mmap, struct, sys
 import rad50
 from ods1_fields import fmt_char, fmt_datim, fmt_protection, fmt_ratt, fmt_uic
 
@@ -31,35 +31,42 @@ def dump_object( obj):
         if not ident.startswith( '__'):
             print( '{}: {}'.format( ident, obj.__dict__[ ident]))
 
-def read_lbn( f, lbn):
-    "Read the selected logical block from an opened virtual disk file"
-    f.seek( Block_SZ * lbn)
-    buf = f.read( Block_SZ)
+if not _debug:
+    # Diagnostics are off; make the dump hooks cost nothing at the call sites
+    dump_buf = dump_object = lambda *args: None
+
+def read_lbn( mem, lbn):
+    "Return the selected logical block of a memory mapped virtual disk"
+    buf = mem[ Block_SZ * lbn: Block_SZ * ( lbn + 1)]
     if( len(buf) != Block_SZ):
         raise OSError( "Incomplete block: read {} bytes of LBN {}".format( len(buf), lbn))
     return buf
 
 def checksum( buf, offset):
     "Validate checksum of the words in the buffer"
-    csum = 0
-    for i in range( 0, offset, 2):
-        csum = ( csum + w2( buf[ i:]))
-    csum &= 0x0FFFF
-    if csum != w2( buf[ offset:]):
+    # Sum all the preceding words in one C-level pass instead of a
+    # Python-level loop over each word.
+    csum = sum( struct.unpack_from( '<{}H'.format( offset // 2), buf)) & 0x0FFFF
+    if csum != struct.unpack_from( '<H', buf, offset)[ 0]:
         raise( Invalid_Block( "Not a valid home block - checksum"))
     return csum
 
-def w2( buf):
-    "extract a word of 2 bytes from beginning of the buf"
-    return buf[ 0] + ( buf[ 1] << 8)
+_u16 = struct.Struct( '<H').unpack_from
+_u16x2 = struct.Struct( '<HH').unpack_from
+
+def w2( buf, off=0):
+    "extract a word of 2 bytes at the given offset in the buf"
+    return _u16( buf, off)[ 0]
 
-def w4( buf):
-    "extract a double word from High, Low words at the start of buf"
-    return ( w2( buf) << 16) + w2( buf[ 2:])
+def w4( buf, off=0):
+    "extract a double word from High, Low words at the given offset in the buf"
+    hi, lo = _u16x2( buf, off)
+    return ( hi << 16) + lo
 
-def wstr( buf, maxlen):
+def wstr( buf, off, maxlen):
     "extract null terminated string from the buffer, convert to ASCII char string"
-    tmp = buf[ : maxlen]
+    # memoryview has no find(); copying the short field is cheap
+    tmp = bytes( buf[ off: off + maxlen])
     end = tmp.find( b'\x00')
     if end >= 0:
         tmp = tmp[ : end]
@@ -87,34 +94,36 @@ class Home_Block:
 
     def get_hb( self, buf):
         "Populate self with home block info"
+        # Cumulative word sums; one pass over the block serves both checksums
+        cum = list( itertools.accumulate( struct.unpack_from( '<256H', buf)))
         offset = 0
         # number of blocks in the index file bitmap
-        self.IBSZ = w2( buf[ offset:]); offset += 2
+        self.IBSZ = w2( buf, offset); offset += 2
         # Index File Bitmap LBN  - high, low word
-        self.IBLB = w4( buf[ offset:]); offset += 4
+        self.IBLB = w4( buf, offset); offset += 4
         # Maximum Number of Files 
-        self.FMAX = w2( buf[ offset:]); offset += 2
+        self.FMAX = w2( buf, offset); offset += 2
         # Storage Bitmap Cluster Factor - Not implemented in ODS-1; must = 1
-        self.SBCL = w2( buf[ offset:]); offset += 2
+        self.SBCL = w2( buf, offset); offset += 2
         # Disk Device Type - not used; always contains 0
-        self.DVTY = w2( buf[ offset:]); offset += 2
+        self.DVTY = w2( buf, offset); offset += 2
         # Volume Structure Level - 
-        self.VLEV = w2( buf[ offset:]); offset += 2
+        self.VLEV = w2( buf, offset); offset += 2
         # Volume Name - 12 ASCII bytes with null padding
-        self.VNAM = wstr( buf[ offset:], 12); offset += 12
+        self.VNAM = wstr( buf, offset, 12); offset += 12
         # 4 bytes Unused
         offset += 4
         # Volume Owner UIC - Programmer (Member), Project (Group)
-        self.VOWN = w2( buf[ offset:]); offset += 2
+        self.VOWN = w2( buf, offset); offset += 2
         self.PROG = self.VOWN & 0xFF
         self.PROJ = self.VOWN >> 8
         # Volume Protection Code
-        self.VPRO = w2( buf[ offset:]); offset += 2
+        self.VPRO = w2( buf, offset); offset += 2
         self.VPRO_STR = fmt_protection( self.VPRO)
         # Volume Characteristics
-        self.VCHA = w2( buf[ offset:]); offset += 2
+        self.VCHA = w2( buf, offset); offset += 2
         # Default File Protection
-        self.DFPR = w2( buf[ offset:]); offset += 2
+        self.DFPR = w2( buf, offset); offset += 2
         self.DFPR_STR = fmt_protection( self.DFPR)
         # 6 bytes Unused
         offset += 6
@@ -125,31 +134,37 @@ class Home_Block:
         # Directory Pre-Access Limit
         self.LRUC = buf[ offset]; offset += 1
         # Date of Last Home Block Revision - ASCII: DDMMMYY
-        self.REVD = buf[ offset: offset + 7].decode( encoding='ascii'); offset += 7
+        self.REVD = bytes( buf[ offset: offset + 7]).decode( encoding='ascii'); offset += 7
         # Count of Home Block Revisions
-        self.REVC = w2( buf[ offset:]); offset += 2
+        self.REVC = w2( buf, offset); offset += 2
         # 2 bytes Unused
         offset += 2
         # First Checksum (of all preceding words)
-        self.CHK1 = checksum( buf, offset); offset += 2
+        self.CHK1 = cum[ offset // 2 - 1] & 0x0FFFF
+        if self.CHK1 != w2( buf, offset):
+            raise( Invalid_Block( "Not a valid home block - checksum"))
+        offset += 2
         # Volume Creation Date - 14 ASCII bytes "DDMMMYYHHMMSS" null padded
-        self.VDAT = wstr( buf[ offset:], 14); offset += 14
+        self.VDAT = wstr( buf, offset, 14); offset += 14
         # 382 bytes Unused
         offset += 382
         # Pack Serial Number - manufacturer supplied
-        self.PKSR = w4( buf[ offset:]); offset += 4
+        self.PKSR = w4( buf, offset); offset += 4
         # 12 bytes Unused
         offset += 12
         # Volume Name (Identity) - 12 ASCII bytes, space padded
-        self.INDN = wstr( buf[ offset:], 12); offset += 12
+        self.INDN = wstr( buf, offset, 12); offset += 12
         # Volume Owner (Name) - 12 ASCII bytes, space padded
-        self.INDO = wstr( buf[ offset:], 12); offset += 12
+        self.INDO = wstr( buf, offset, 12); offset += 12
         # Format Type - 12 ASCII bytes, space padded
-        self.INDF = wstr( buf[ offset:], 12); offset += 12
+        self.INDF = wstr( buf, offset, 12); offset += 12
         # 2 bytes Unused
         offset += 2
         # Second Checksum (of all preceding words)
-        self.CHK2 = checksum( buf, offset); offset += 2
+        self.CHK2 = cum[ offset // 2 - 1] & 0x0FFFF
+        if self.CHK2 != w2( buf, offset):
+            raise( Invalid_Block( "Not a valid home block - checksum"))
+        offset += 2
  
         # Home block validation
         if self.IBSZ == 0 or \
@@ -175,99 +190,87 @@ Defaults: LRU={LRUC} EXT={FIEX} WIN={WISZ} F_Prot={DFPR_STR}'''
 class File_Header:
     "File Header"
 
+    # Header Area: IDOF MPOF FNUM FSEQ FLEV FOWN FPRO UCHA SCHA UFAT
+    _HDR = struct.Struct( '<BBHHHHHBB32s')
+    # FCS attributes in UFAT: RTYP RATT RSIZ HIBK(hi,lo) EFBK(hi,lo) FFBY
+    _FCS = struct.Struct( '<BBHHHHHH')
+    # Ident Area words: FNAM(x3) FTYP FVER RVNO
+    _IDENT = struct.Struct( '<HHHHHH')
+    # Map Area: ESQN ERVN EFNU EFSQ CTSZ LBSZ USE MAX
+    _MAP = struct.Struct( '<BBHHBBBB')
+
     def __init__( self, buf):
         "Populate self with file header info"
         dump_buf( 'fh', buf)
-        offset = 0
-        # Ident Area Offset in 16-bit words
-        self.IDOF = buf[ offset]; offset += 1
-        # Map Area Offset in 16-bit words
-        self.MPOF = buf[ offset]; offset += 1
-        # File Number
-        self.FNUM = w2( buf[ offset:]); offset += 2
-        # File Sequence Number
-        self.FSEQ = w2( buf[ offset:]); offset += 2
-        # File Structure Level
-        self.FLEV = w2( buf[ offset:]); offset += 2
+        # 3.4.1  Header Area Description  -
+        ( self.IDOF,   # Ident Area Offset in 16-bit words
+          self.MPOF,   # Map Area Offset in 16-bit words
+          self.FNUM,   # File Number
+          self.FSEQ,   # File Sequence Number
+          self.FLEV,   # File Structure Level
+          self.FOWN,   # File Owner UIC - Programmer (Member), Project (Group)
+          self.FPRO,   # File Protection Code
+          self.UCHA,   # User Controlled Characteristics
+          self.SCHA,   # System Controlled Characteristics
+          self.UFAT,   # User Attribute Area - 32 bytes
+          ) = self._HDR.unpack_from( buf, 0)
         if self.FLEV != 0o401:
             raise( Invalid_Block( "Not a valid file header FLEV"))
-        # File Owner UIC - Programmer (Member), Project (Group)
-        self.FOWN = w2( buf[ offset:]); offset += 2
         self.PROG = self.FOWN & 0xFF
         self.PROJ = self.FOWN >> 8
-        # File Protection Code
-        self.FPRO = w2( buf[ offset:]); offset += 2
         self.FPRO_STR = fmt_protection( self.FPRO)
-        # File Characteristics - 2 bytes
-        # User Controlled Characteristics
-        self.UCHA = buf[ offset]; offset += 1
-        # System Controlled Characteristics
-        self.SCHA = buf[ offset]; offset += 1
-        # User Attribute Area - 32 bytes
-        self.UFAT = buf[ offset: offset + 32]; offset += 32
 
         # get FCS attributes
-        offset = 0
-        # Record Type
-        self.RTYP = self.UFAT[ offset]; offset += 1
-        # Record Attributes
-        self.RATT = self.UFAT[ offset]; offset += 1
-        # Record Size
-        self.RSIZ = w2( self.UFAT[ offset:]); offset += 2
-        # Highest VBN Allocated
-        self.HIBK = w4( self.UFAT[ offset:]); offset += 4
-        # End of File Block
-        self.EFBK = w4( self.UFAT[ offset:]); offset += 4
-        # First Free Byte
-        self.FFBY = w2( self.UFAT[ offset:]); offset += 2
-
-        # 3.4.1.10  S.HDHD  46 bytes  Size of Header Area  - 
-        # 3.4.2  Ident Area Description  - 
+        ( self.RTYP,   # Record Type
+          self.RATT,   # Record Attributes
+          self.RSIZ,   # Record Size
+          hibk_hi, hibk_lo,  # Highest VBN Allocated - high, low word
+          efbk_hi, efbk_lo,  # End of File Block - high, low word
+          self.FFBY,   # First Free Byte
+          ) = self._FCS.unpack_from( self.UFAT, 0)
+        self.HIBK = ( hibk_hi << 16) + hibk_lo
+        self.EFBK = ( efbk_hi << 16) + efbk_lo
+
+        # 3.4.1.10  S.HDHD  46 bytes  Size of Header Area  -
+        # 3.4.2  Ident Area Description  -
         offset = 2 * self.IDOF
-        # File Name
-        self.FNAM = rad50.decode_words( [
-            w2( buf[ offset:]), w2( buf[ offset + 2:]), w2( buf[ offset + 4:])])
-        offset += 6
-        # File Type
-        self.FTYP = rad50.decode_words( [ w2( buf[ offset:])]); offset += 2
-        # Version Number
-        self.FVER = w2( buf[ offset:]); offset += 2
-        # Revision Number
-        self.RVNO = w2( buf[ offset:]); offset += 2
+        ( fnam0, fnam1, fnam2,  # File Name - 3 RAD50 words
+          ftyp,        # File Type - 1 RAD50 word
+          self.FVER,   # Version Number
+          self.RVNO,   # Revision Number
+          ) = self._IDENT.unpack_from( buf, offset)
+        self.FNAM = rad50.decode_wd( fnam0) + rad50.decode_wd( fnam1) \
+            + rad50.decode_wd( fnam2)
+        self.FTYP = rad50.decode_wd( ftyp)
+        offset += self._IDENT.size
         # Revision Date - 7 ASCII bytes
-        self.RVDT = wstr( buf[ offset:], 7); offset += 7
+        self.RVDT = wstr( buf, offset, 7); offset += 7
         # Revision Time - 6 ASCII bytes
-        self.RVTI = wstr( buf[ offset:], 6); offset += 6
+        self.RVTI = wstr( buf, offset, 6); offset += 6
         # Creation Date - 7 ASCII bytes
-        self.CRDT = wstr( buf[ offset:], 7); offset += 7
+        self.CRDT = wstr( buf, offset, 7); offset += 7
         # Creation Time - 6 ASCII bytes
-        self.CRTI = wstr( buf[ offset:], 6); offset += 6
+        self.CRTI = wstr( buf, offset, 6); offset += 6
         # Expiration Date - 7 ASCII bytes
-        self.EXDT = wstr( buf[ offset:], 7); offset += 7
+        self.EXDT = wstr( buf, offset, 7); offset += 7
         # Unused 1 byte
         offset += 1
 
         # 3.4.2.11  S.IDHD  46 bytes  Size of Ident Area
         # 3.4.3  Map Area -
         offset = 2 * self.MPOF
-        # Extension Segment Number
-        self.ESQN = buf[ offset]; offset += 1
-        # Extension Relative Volume Number
-        self.ERVN = buf[ offset]; offset += 1
-        # Extension File Number
-        self.EFNU = w2( buf[ offset:]); offset += 2
-        # Extension File Sequence Number
-        self.EFSQ = w2( buf[ offset:]); offset += 2
-        # Block Count Field Size
-        self.CTSZ = buf[ offset]; offset += 1
-        # LBN Field Size
-        self.LBSZ = buf[ offset]; offset += 1
+        ( self.ESQN,   # Extension Segment Number
+          self.ERVN,   # Extension Relative Volume Number
+          self.EFNU,   # Extension File Number
+          self.EFSQ,   # Extension File Sequence Number
+          self.CTSZ,   # Block Count Field Size
+          self.LBSZ,   # LBN Field Size
+          self.USE,    # Map Words in Use
+          self.MAX,    # Map Words Available
+          ) = self._MAP.unpack_from( buf, offset)
         if ( self.CTSZ + self.LBSZ) & 1:
             raise( Invalid_Block( "Not a valid file header CTSZ+LBSZ"))
-        # Map Words in Use
-        self.USE = buf[ offset]; offset += 1
-        # Map Words Available
-        self.MAX = buf[ offset]; offset += 1
+        offset += self._MAP.size
         assert self.MAX == ( Block_SZ - ( offset + 2)) / 2
         assert self.USE <= self.MAX and self.USE >= 0
 
@@ -278,7 +281,7 @@ class File_Header:
         while i > 0:
             lbn = buf[ offset]; offset += 1
             cnt = buf[ offset]; offset += 1
-            lbn = ( lbn << 16) + w2( buf[ offset:]); offset += 2
+            lbn = ( lbn << 16) + w2( buf, offset); offset += 2
             i -= 2
             self.RTRV.extend( [ ( cnt + 1, lbn)])
         assert i == 0
@@ -306,6 +309,8 @@ class Index_File:
         "Populate self from home block on this disk"
         self.f = hb.f
         self.fh_base_vbn = 2 + hb.IBSZ # VBN for file header [0,0]
+        # Cache parsed headers; directory traversal revisits the same files
+        self.fh = functools.lru_cache( maxsize=4096)( self.fh)
         # Get first header for index file
         h = File_Header( read_lbn( self.f, hb.IBLB + hb.IBSZ))
         assert h.FNUM == 1
@@ -318,11 +323,12 @@ class Index_File:
     def fh_lbn( self, fileno):
         "Get LBN of the file header for a given file number"
         vbn = fileno + self.fh_base_vbn
-        ret_ptrs = copy.copy( self.RTRV)
-        cnt, lbn = ret_ptrs.pop(0)
+        i = 0
+        cnt, lbn = self.RTRV[ 0]
         while vbn > cnt:
             vbn -= cnt
-            cnt, lbn = ret_ptrs.pop(0)
+            i += 1
+            cnt, lbn = self.RTRV[ i]
         return lbn + vbn - 1
 
     def fh( self, fileno):
@@ -338,7 +344,8 @@ class File:
         "populate self from given file number of the index file"
         self.f = idxf.f
         self.fh = idxf.fh( fileno)
-        self.RTRV = self.fh.RTRV # Retrieval Pointers
+        # Copy the Retrieval Pointers; the header may be shared via the cache
+        self.RTRV = list( self.fh.RTRV)
         efnu = self.fh.EFNU
         # get any additional headers and retrieval pointers
         while efnu != 0:
@@ -351,6 +358,18 @@ class File:
                         'FVER', 'HIBK', 'PROG', 'PROJ', 'RATT', 'RSIZ', 'RTYP',
                         'RVDT', 'RVNO', 'RVTI', 'UFAT'):
                 assert self.fh.__dict__[ id] == h.__dict__[ id]
+        # Cumulative block counts, so read_vb can binary search for the
+        # retrieval pointer covering a VBN
+        self._cum = list( itertools.accumulate( cnt for cnt, lbn in self.RTRV))
+        # Dense VBN -> LBN map makes read_vb a single index; skipped for
+        # very large files to bound the memory spent on the map
+        total = self._cum[ -1] if self._cum else 0
+        if total <= 1 << 16:
+            self._vbn2lbn = array.array( 'q')
+            for cnt, lbn in self.RTRV:
+                self._vbn2lbn.extend( range( lbn, lbn + cnt))
+        else:
+            self._vbn2lbn = None
 
     def is_dir( self):
         "Predicate indicating whether this file is a directory"
@@ -358,12 +377,12 @@ class File:
 
     def read_vb( self, vbn):
         "Return a buffer containing the selected VBN of this file"
-        ret_ptrs = copy.copy( self.RTRV)
-        cnt, lbn = ret_ptrs.pop(0)
-        while vbn > cnt:
-            vbn -= cnt
-            cnt, lbn = ret_ptrs.pop(0)
-        return( read_lbn( self.f, lbn + vbn - 1))
+        if self._vbn2lbn is not None:
+            return( read_lbn( self.f, self._vbn2lbn[ vbn - 1]))
+        i = bisect.bisect_left( self._cum, vbn)
+        base = self._cum[ i - 1] if i else 0
+        cnt, lbn = self.RTRV[ i]
+        return( read_lbn( self.f, lbn + ( vbn - base) - 1))
 
     def enumerate_dirent( self):
         "Iterator to enumerate all the directory entries in this file"
@@ -380,47 +399,48 @@ class File:
             for offset in range( 0, Block_SZ, self.fh.RSIZ):
                 if vbn == self.fh.EFBK and offset >= self.fh.FFBY:
                     break
-                de = Dir_Ent( vb[ offset: ])
-                if de.is_valid():
-                    yield de
+                # Check FNUM before decoding; empty slots are common and
+                # not worth a Dir_Ent construction
+                if vb[ offset] or vb[ offset + 1]:
+                    yield Dir_Ent( vb, offset)
 
     def data_hash( self):
         "SHA sum all the data in this file"
         length = 0
         m = hashlib.sha256()
-        last_vbn_used = self.fh.EFBK
-        if self.fh.FFBY == 0:
-            last_vbn_used -= 1
-        for vbn in range( 1, last_vbn_used + 1):
-            vb = self.read_vb( vbn)
-            if vbn == self.fh.EFBK:
-                vb = vb[ : self.fh.FFBY]
-                length += self.fh.FFBY
-            else:
-                length += Block_SZ
-            m.update( vb)
+        # Data bytes in the file: all blocks before EFBK plus FFBY bytes in it
+        remaining = ( self.fh.EFBK - 1) * Block_SZ + self.fh.FFBY
+        # Read and hash one whole extent at a time rather than block by block
+        for cnt, lbn in self.RTRV:
+            if remaining <= 0:
+                break
+            want = min( cnt * Block_SZ, remaining)
+            chunk = self.f[ Block_SZ * lbn: Block_SZ * lbn + want]
+            if( len( chunk) != want):
+                raise OSError( "Incomplete extent: read {} bytes of LBN {}".format( len( chunk), lbn))
+            m.update( chunk)
+            length += want
+            remaining -= want
         return length, m.hexdigest()
 
 class Dir_Ent:
     "A Directory Entry"
 
-    def __init__( self, buf):
-        "populate self from a buffer"
-        offset = 0
+    def __init__( self, buf, off=0):
+        "populate self from the given offset in a buffer"
+        offset = off
         # File Number
-        self.FNUM = w2( buf[ offset:]); offset += 2
+        self.FNUM = w2( buf, offset); offset += 2
         # File Sequence Number
-        self.FSEQ = w2( buf[ offset:]); offset += 2
+        self.FSEQ = w2( buf, offset); offset += 2
         # File Relative Volume Number
-        self.FRVN = w2( buf[ offset:]); offset += 2
+        self.FRVN = w2( buf, offset); offset += 2
         # File Name
-        self.FNAM = rad50.decode_words( [
-            w2( buf[ offset:]), w2( buf[ offset + 2:]), w2( buf[ offset + 4:])])
-        offset += 6
+        self.FNAM = rad50.decode_3wd( buf, offset); offset += 6
         # File Type
-        self.FTYP = rad50.decode_words( [ w2( buf[ offset:])]); offset += 2
+        self.FTYP = rad50.decode_wd( w2( buf, offset)); offset += 2
         # Version Number
-        self.FVER = w2( buf[ offset:]); offset += 2
+        self.FVER = w2( buf, offset); offset += 2
 
     def is_valid( self):
         "Predicate indicating whether this is a valid directory entry"
@@ -448,7 +468,10 @@ def recursive_listing( idxf, dir_name='000000', file_num=4):
 def list_disk( filepath):
     "List contents of the virtual disk in the specified file path"
     with open( filepath, 'rb') as f:
-        hb = Home_Block( f)
+        # Map the image and parse through zero-copy memoryview slices;
+        # the mapping is reclaimed once the last slice is dropped
+        mem = memoryview( mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ))
+        hb = Home_Block( mem)
         print( '\nFile:', filepath, hb)
         recursive_listing( Index_File( hb))
 
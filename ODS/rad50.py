@@ -5,27 +5,34 @@
    Note that on 18/36 bit systems DEC used a different ordering of the
    characters in the RAD50 alphabet array."""
 
-import io
+import struct
 
 alphabet = " ABCDEFGHIJKLMNOPQRSTUVWXYZ$.%0123456789"
 radix = len( alphabet)
 char_per_wd = 3
 
-def decode_wd( buf, wd):
-    "Convert 16 bit word to 3 ASCII characters, appended to the supplied buffer"
-    divisor = radix * radix
-    for i in range( char_per_wd):
-        buf.write( alphabet[ wd // divisor % radix])
-        divisor //= radix
+# 3 character decode of every possible 16 bit word, built once at import.
+# Covers the full 64K range so illegal words >= radix**3 decode the same
+# as the old divide/modulus arithmetic did.
+_TABLE = tuple( alphabet[ wd // ( radix * radix) % radix]
+                + alphabet[ wd // radix % radix]
+                + alphabet[ wd % radix]
+                for wd in range( 1 << 16))
+
+def decode_wd( wd):
+    "Convert 16 bit word to 3 ASCII characters"
+    return _TABLE[ wd]
 
 def decode_words( iterable):
     "Convert sequence of words into a string"
-    buf = io.StringIO()
-    for wd in iterable:
-        decode_wd( buf, wd)
-    result = buf.getvalue()
-    buf.close()
-    return result
+    return ''.join( _TABLE[ wd] for wd in iterable)
+
+_3wds = struct.Struct( '<HHH').unpack_from
+
+def decode_3wd( buf, off=0):
+    "Convert 3 words at the given buffer offset to 9 ASCII characters"
+    w0, w1, w2 = _3wds( buf, off)
+    return _TABLE[ w0] + _TABLE[ w1] + _TABLE[ w2]
 
 def encode_wd( chars):
     "Convert up to 3 chars into a rad50 word"
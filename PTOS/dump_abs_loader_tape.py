@@ -23,7 +23,7 @@ The last record has a length == 6.  If the Address in that record is even,
 the absolute loader jumps to that address (plus optional relocation factor);
 otherwise the absolute loader halts at xxx710.
 """
-import sys
+import struct, sys
 
 verbose = False
 
@@ -31,6 +31,12 @@ ASCII = ("." * 32) + " !\"#$%&'()*+,-./0123456789:;<=>?" + \
         "@ABCSEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~." + \
         ( "." * 128)
 
+# Same mapping as a 256-byte table for bytes.translate
+_PRINT = bytes(ord(ASCII[i]) for i in range(256))
+
+# 6-digit octal rendering of every 16-bit value, built once at import
+_OCT6 = tuple(format(wd, "06o") for wd in range(1 << 16))
+
 class Dump_Absolute_Loader_File():
     def __init__(self, infile):
         self._infile = infile
@@ -38,7 +44,10 @@ class Dump_Absolute_Loader_File():
         self._record_length = 0
         self._record_number = 0
         self._sum = 0
-        self._vm = {}
+        # Loaded memory image: the 64 KiB PDP-11 address space plus a
+        # presence bitmap with one bit per byte
+        self._mem = bytearray( 0x10000)
+        self._present = bytearray( 0x2000)
 
     def read_frame(self):
         "read one byte from the input tape"
@@ -56,6 +65,43 @@ class Dump_Absolute_Loader_File():
         "read one 16-bit word from the input tape"
         return self.read_frame() + 256 * self.read_frame()
 
+    def read_block(self, count):
+        "read count bytes from the input tape with a single read"
+        data = self._infile.read(count)
+        if len(data) != count:
+            raise EOFError("Reading PT beyond EOF")
+        self._sum += sum(data)   # C-level reduction over the whole block
+        self._record_length -= count
+        return data
+
+    def _mark_present(self, addr, length):
+        "set the presence bits for length bytes starting at addr"
+        end = addr + length
+        first = addr >> 3
+        last = (end - 1) >> 3
+        if first == last:
+            self._present[first] |= ((1 << length) - 1) << (addr & 7)
+            return
+        self._present[first] |= (0xFF << (addr & 7)) & 0xFF
+        self._present[first + 1:last] = b'\xff' * (last - first - 1)
+        self._present[last] |= (1 << (((end - 1) & 7) + 1)) - 1
+
+    def _load(self, data):
+        "store a record's data bytes into memory at the current address"
+        addr = self._address & 0xFFFF
+        end = addr + len(data)
+        if end <= 0x10000:
+            self._mem[addr:end] = data
+            self._mark_present(addr, len(data))
+        else:
+            # record wraps around the top of the address space
+            split = 0x10000 - addr
+            self._mem[addr:] = data[:split]
+            self._mark_present(addr, split)
+            self._mem[:end - 0x10000] = data[split:]
+            self._mark_present(0, end - 0x10000)
+        self._address += len(data)
+
     def dump_rec(self):
         "read  & process a record, return bool whether to continue"
         self._record_number += 1
@@ -63,10 +109,15 @@ class Dump_Absolute_Loader_File():
         while frame != 1:
             self._sum = 0
             frame = self.read_frame()
-        frame = self.read_frame() # ignored
-        self._record_length = self.read_word() - 4
+        # Rest of the record header: ignored byte, length word, address word
+        hdr = self._infile.read(5)
+        if len(hdr) != 5:
+            raise EOFError("Reading PT beyond EOF")
+        self._sum += sum(hdr)
+        length, address = struct.unpack_from("<HH", hdr, 1)
+        self._record_length = length - 6   # count of data bytes
         old_addr = self._address
-        self._address = self.read_word()
+        self._address = address
         if verbose and self._address != old_addr:
             print(" --- Address discontinuity")
         next_addr = self._address + self._record_length
@@ -83,10 +134,8 @@ class Dump_Absolute_Loader_File():
             else:
                 print(f"Jump to Transfer Address: {self._address:06o}")
         else:
-            for indx in range( self._record_length):
-                self._vm[self._address] = self.read_frame()
-                self._address += 1
-            self.read_frame()
+            self._load(self.read_block(self._record_length))
+            self.read_frame()   # checksum byte
             if self._sum & 0xFF:
                 print("*** CHECKSUM ERROR")
             else:
@@ -97,45 +146,51 @@ class Dump_Absolute_Loader_File():
         print(f"\nContiguous addr range {low:06o} thru {high:06o}")
         bpl = 16 # bytes per line
         for addr in range( low - low % bpl, high, bpl):
+            mask = self._present[addr >> 3] | (self._present[(addr >> 3) + 1] << 8)
+            if mask == 0xFFFF:
+                # Whole line loaded: unpack the words in one call and
+                # translate the ASCII column branchlessly
+                words = struct.unpack_from("<8H", self._mem, addr)
+                lb = "".join(" " + _OCT6[wd] for wd in words)
+                lt = self._mem[addr:addr + bpl].translate(_PRINT).decode("ascii")
+                print(f"{_OCT6[addr]}:{lb} {lt}")
+                continue
             lb = "" # octal words
             lt = "" # ASCII chars
             for offset in range(0, bpl, 2):
-                try:
-                    wd = self._vm[addr + offset]
-                except KeyError:
-                    wd = None
-                try:
-                    high_bits = self._vm[addr + offset + 1] << 8
-                    wd += high_bits
-                except KeyError:
-                    pass
-                except TypeError:
-                    wd = high_bits
+                lo = addr + offset
+                hi = lo + 1
+                wd = None
+                if self._present[lo >> 3] & (1 << (lo & 7)):
+                    wd = self._mem[lo]
+                if self._present[hi >> 3] & (1 << (hi & 7)):
+                    high_bits = self._mem[hi] << 8
+                    wd = high_bits if wd is None else wd + high_bits
                 if wd is None:
                     lb += "       "
                     lt += "  "
                 else:
-                    lb += f" {wd:06o}"
+                    lb += " " + _OCT6[wd]
                     lt += ASCII[ wd & 0xFF] + ASCII [ wd >> 8 ]
-            print(f"{addr:06o}:{lb} {lt}")
+            print(f"{_OCT6[addr]}:{lb} {lt}")
+
+    def _present_runs(self):
+        "Generate (low, high) bounds of each contiguous range of loaded bytes"
+        # Treat the bitmap as one big integer; bit tricks find each run of
+        # ones without probing the 64K addresses individually
+        bits = int.from_bytes(self._present, "little")
+        while bits:
+            start = (bits & -bits).bit_length() - 1
+            tail = bits >> start
+            length = (tail ^ (tail + 1)).bit_length() - 1
+            yield start, start + length - 1
+            bits = (bits >> (start + length)) << (start + length)
 
     def dump_tape(self):
         while self.dump_rec():
             pass
-        if len(self._vm) > 0:
-            prev_addr = None
-            for addr in sorted(self._vm):
-                if prev_addr is None:
-                    # starting the first contiguous range of addresses
-                    low_addr = prev_addr = addr
-                elif prev_addr + 1 == addr:
-                    # continuing within a contiguous range of addresses
-                    prev_addr = addr
-                else:
-                    # finish one range and start the next
-                    self.print_range(low_addr, prev_addr)
-                    low_addr = prev_addr = addr
-            self.print_range(low_addr, prev_addr)
+        for low_addr, high_addr in self._present_runs():
+            self.print_range(low_addr, high_addr)
 
 def main( argv):
     "Process multiple files"
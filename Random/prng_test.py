@@ -25,30 +25,69 @@ test_cases = [
 # apart or d2 is greater than 0.25.  This test counts how many pairs of points
 # have d2 > 0.25.
 
-for test in test_cases:
-    a, c = test["a"], test["c"]
-    m = test.get( 'm', 2 ** 16)
-    seed = test.get( "seed", 0)
-    print( "\nStarting with X[0]={seed}, X[n+1] = (X[n] * {a} + {c}) mod {m}"
-            .format( **locals()))
-    d = {}
+def find_period( a, c, m, seed):
+    """Generate random numbers until a repeat occurs.
+
+    Uses Floyd's tortoise-and-hare cycle detection, which needs O(1)
+    state instead of one seen-flag per possible value: first locate a
+    meeting point inside the cycle, then the tail length mu (steps
+    before the cycle starts) and the cycle length lam.  The sequence
+    repeats after mu + lam numbers, with X[mu] the first value to
+    re-occur.  A final pass over those numbers runs the D^2 test.
+
+    Returns the count of numbers found, the first repeated number and
+    the count of point pairs with d2 > 0.25."""
+    def f( x):
+        return (x * a + c) % m         # generate the next random number
+    # Find a meeting point inside the cycle
+    tortoise = f( seed)
+    hare = f( f( seed))
+    while tortoise != hare:
+        tortoise = f( tortoise)
+        hare = f( f( hare))
+    # Find mu, the number of steps before the cycle starts
+    mu = 0
+    tortoise = seed
+    while tortoise != hare:
+        tortoise = f( tortoise)
+        hare = f( hare)
+        mu += 1
+    repeat = tortoise                  # X[mu], the first value to re-occur
+    # Find lam, the length of the cycle
+    lam = 1
+    hare = f( tortoise)
+    while tortoise != hare:
+        hare = f( hare)
+        lam += 1
+    num_found = mu + lam
+    # D^2 test over the num_found distinct numbers, in generation order
     num_gtr = 0
-    while seed not in d:
-        d[seed] = None
-        if len(d) % 4 == 1:
+    x1 = y1 = x2 = 0.0
+    for n in range( 1, num_found + 1):
+        phase = n % 4
+        if phase == 1:
             x1 = float( seed) / m
-        if len(d) % 4 == 2:
+        elif phase == 2:
             y1 = float( seed) / m
-        if len(d) % 4 == 3:
+        elif phase == 3:
             x2 = float( seed) / m
-        if len(d) % 4 == 0:
+        else:
             y2 = float( seed) / m
             d2 = ( x2 - x1) ** 2 + ( y2 - y1) ** 2
             if d2 > 0.25:
                 num_gtr += 1
-        seed = (seed * a + c) % m      # generate the next random number
+        seed = f( seed)
+    return num_found, repeat, num_gtr
+
+for test in test_cases:
+    a, c = test["a"], test["c"]
+    m = test.get( 'm', 2 ** 16)
+    seed = test.get( "seed", 0)
+    print( "\nStarting with X[0]={seed}, X[n+1] = (X[n] * {a} + {c}) mod {m}"
+            .format( **locals()))
+    num_found, repeat, num_gtr = find_period( a, c, m, seed)
     print( "RNG repeated with {}., after finding {} numbers"
-            .format( seed, len(d)))
-    print( "{:.5}% of d2 is greater than 0.25 (50% expected)".format( 100. * num_gtr / ( len(d) / 4)))
+            .format( repeat, num_found))
+    print( "{:.5}% of d2 is greater than 0.25 (50% expected)".format( 100. * num_gtr / ( num_found / 4)))
 
 